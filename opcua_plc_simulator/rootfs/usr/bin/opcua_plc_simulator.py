@@ -2,17 +2,36 @@
 from __future__ import annotations
 
 import asyncio
+import heapq
+import itertools
 import math
 import os
 import random
 import time
 from dataclasses import dataclass
+from enum import IntEnum
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Coroutine
 
 import yaml
-from asyncua import Server
+from asyncua import Server, ua
 
+# Prefer the libyaml-backed loader; fall back to the pure-Python one.
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Local aliases for the simulation step functions.
+_rand_uniform = random.uniform
+_rand_choice = random.choice
+_sin = math.sin
+_TWO_PI = 2.0 * math.pi
+
+# Lower bound for simulation intervals; keeps the scheduler from spinning.
+MIN_INTERVAL_MS = 100
+
+# Read/write errors that suspend a binding with exponential backoff. Anything else
+# (including cancellation) is re-raised once the rest of the batch is done.
+_RETRYABLE_ERRORS = (asyncio.TimeoutError, ConnectionError, ua.UaError)
+MAX_BACKOFF_NS = 60_000_000_000
 
 EXAMPLE_CONFIG = """server:
   endpoint: opc.tcp://0.0.0.0:4840
@@ -93,36 +112,187 @@ model:
       initial: false
       writable: true
 """
+_EXAMPLE_CONFIG_BYTES = EXAMPLE_CONFIG.encode("utf-8")
+
+
+_TRUE_STRINGS = frozenset({"1", "true", "yes", "on"})
 
 
 def _to_bool(value: Any) -> bool:
-    if isinstance(value, bool):
+    if value is True or value is False:
         return value
+    if type(value) is int:
+        return value != 0
     if isinstance(value, (int, float)):
         return bool(value)
-    return str(value).strip().lower() in {"1", "true", "yes", "on"}
+    return str(value).strip().lower() in _TRUE_STRINGS
+
+
+def _to_int(value: Any) -> int:
+    return int(float(value))
+
+
+class DType(IntEnum):
+    BOOL = 0
+    INT = 1
+    FLOAT = 2
+    STR = 3
+
+
+_DTYPE_MAP = {
+    "bool": DType.BOOL,
+    "boolean": DType.BOOL,
+    "int": DType.INT,
+    "integer": DType.INT,
+    "int32": DType.INT,
+    "int64": DType.INT,
+    "uint16": DType.INT,
+    "uint32": DType.INT,
+    "float": DType.FLOAT,
+    "double": DType.FLOAT,
+    "number": DType.FLOAT,
+}
+
+# Indexed by DType.
+_CAST_FNS: tuple[Callable[[Any], Any], ...] = (_to_bool, _to_int, float, str)
+
+
+# Indexed by DType; matches what asyncua infers from the cast Python values.
+_VARIANT_TYPES: tuple[ua.VariantType, ...] = (
+    ua.VariantType.Boolean,
+    ua.VariantType.Int64,
+    ua.VariantType.Double,
+    ua.VariantType.String,
+)
+
+
+def _resolve_dtype(dtype: str) -> DType:
+    return _DTYPE_MAP.get(str(dtype).lower().strip(), DType.STR)
+
+
+class Mode(IntEnum):
+    HOLD = 0
+    TOGGLE = 1
+    RANDOM_WALK = 2
+    RANDOM_CHOICE = 3
+    CYCLE = 4
+    RAMP = 5
+    SINE = 6
+
+
+_MODE_MAP = {
+    "toggle": Mode.TOGGLE,
+    "random_walk": Mode.RANDOM_WALK,
+    "random_choice": Mode.RANDOM_CHOICE,
+    "cycle": Mode.CYCLE,
+    "ramp": Mode.RAMP,
+    "sine": Mode.SINE,
+}
+
+
+def _resolve_mode(sim_cfg: dict[str, Any]) -> Mode:
+    mode = _MODE_MAP.get(str(sim_cfg.get("mode", "")).lower().strip(), Mode.HOLD)
+    if mode in (Mode.RANDOM_CHOICE, Mode.CYCLE):
+        values = sim_cfg.get("values", [])
+        if not (isinstance(values, list) and values):
+            return Mode.HOLD
+    return mode
+
+
+StepFn = Callable[["SimBinding", int, Any], Any]
+
+
+def _step_hold(b: SimBinding, now_ns: int, current: Any) -> Any:
+    return current
 
 
-def _cast(dtype: str, value: Any) -> Any:
-    dtype = str(dtype).lower().strip()
-    if dtype in {"bool", "boolean"}:
-        return _to_bool(value)
-    if dtype in {"int", "integer", "int32", "int64", "uint16", "uint32"}:
-        return int(float(value))
-    if dtype in {"float", "double", "number"}:
-        return float(value)
-    return str(value)
+def _step_toggle(b: SimBinding, now_ns: int, current: Any) -> Any:
+    return not _to_bool(current)
 
 
-@dataclass
+def _step_random_walk(b: SimBinding, now_ns: int, current: Any) -> Any:
+    cur = float(current) + _rand_uniform(-b.step, b.step)
+    return max(b.vmin, min(b.vmax, cur))
+
+
+def _step_random_choice(b: SimBinding, now_ns: int, current: Any) -> Any:
+    return _rand_choice(b.values)
+
+
+def _step_cycle(b: SimBinding, now_ns: int, current: Any) -> Any:
+    b.cycle_index = (b.cycle_index + 1) % len(b.values)
+    return b.values[b.cycle_index]
+
+
+def _step_ramp(b: SimBinding, now_ns: int, current: Any) -> Any:
+    cur = float(current) + b.step
+    if cur > b.vmax:
+        cur = b.vmin
+    if cur < b.vmin:
+        cur = b.vmax
+    return cur
+
+
+def _step_sine(b: SimBinding, now_ns: int, current: Any) -> Any:
+    b.phase += b.dphase
+    if b.phase >= _TWO_PI:
+        b.phase -= _TWO_PI
+    return b.center + b.amp * _sin(b.phase)
+
+
+# Indexed by Mode.
+_STEP_HANDLERS: tuple[StepFn, ...] = (
+    _step_hold,
+    _step_toggle,
+    _step_random_walk,
+    _step_random_choice,
+    _step_cycle,
+    _step_ramp,
+    _step_sine,
+)
+
+
+def _is_precast(mode: Mode, dtype_id: DType) -> bool:
+    """Whether the step handler already yields values of the binding's dtype.
+
+    ``values`` are cast at setup and hold returns the last written value.
+    """
+    if mode is Mode.TOGGLE:
+        return dtype_id is DType.BOOL
+    return mode in (Mode.HOLD, Mode.CYCLE, Mode.RANDOM_CHOICE)
+
+
+def _reads_current(mode: Mode, sim_cfg: dict[str, Any]) -> bool:
+    """Only random_walk follows the server value; other modes keep their state locally.
+
+    Set ``simulation.trust_local: true`` to let random_walk step from the last written
+    value as well when nothing else writes to the node.
+    """
+    return mode is Mode.RANDOM_WALK and not _to_bool(sim_cfg.get("trust_local", False))
+
+
+@dataclass(slots=True)
 class SimBinding:
     node: Any
     node_id: str
-    dtype: str
-    simulation: dict[str, Any]
-    next_due: float
+    next_due_ns: int
+    interval_ns: int
+    step_fn: StepFn
+    cast_fn: Callable[[Any], Any]
+    variant_type: ua.VariantType
+    step: float = 1.0
+    vmin: float = 0.0
+    vmax: float = 100.0
+    values: tuple[Any, ...] = ()
+    precast: bool = False
+    dphase: float = 0.0
+    center: float = 50.0
+    amp: float = 50.0
+    last_value: Any = None
+    read_current: bool = False
     cycle_index: int = 0
     phase: float = 0.0
+    fail_count: int = 0
 
 
 class PlcSimulator:
@@ -130,6 +300,7 @@ class PlcSimulator:
         self.cfg = cfg
         self.server = Server()
         self.bindings: list[SimBinding] = []
+        self._heap: list[tuple[int, int, SimBinding]] = []
         self.default_tick_ms = int(cfg.get("server", {}).get("tick_ms", 1000))
 
     async def setup(self) -> None:
@@ -148,7 +319,7 @@ class PlcSimulator:
         root_name = model.get("root", "Machine")
 
         objects_cache: dict[str, Any] = {"": self.server.nodes.objects}
-        await self._ensure_object_path(objects_cache, ns_idx, root_name)
+        await self._ensure_object_path(objects_cache, ns_idx, self._path_parts(root_name))
 
         variables = model.get("variables", [])
         if not isinstance(variables, list):
@@ -162,7 +333,10 @@ class PlcSimulator:
             path = str(item.get("path") or f"{root_name}/{name}")
             dtype = str(item.get("type") or "float").lower()
             writable = bool(item.get("writable", True))
-            initial = _cast(dtype, item.get("initial", False if dtype == "bool" else 0))
+            dtype_id = _resolve_dtype(dtype)
+            cast_fn = _CAST_FNS[dtype_id]
+            variant_type = _VARIANT_TYPES[dtype_id]
+            initial = cast_fn(item.get("initial", False if dtype == "bool" else 0))
 
             parent_path, leaf = self._split_path(path)
             parent = await self._ensure_object_path(objects_cache, ns_idx, parent_path)
@@ -176,7 +350,7 @@ class PlcSimulator:
                 canonical = path.replace("/", ".")
                 node_id = f"ns={ns_idx};s={canonical}"
 
-            var_node = await parent.add_variable(node_id, leaf, initial)
+            var_node = await parent.add_variable(node_id, leaf, initial, varianttype=variant_type)
             if writable:
                 await var_node.set_writable()
 
@@ -184,118 +358,144 @@ class PlcSimulator:
 
             sim_cfg = item.get("simulation")
             if isinstance(sim_cfg, dict) and sim_cfg.get("mode"):
-                interval_ms = int(sim_cfg.get("interval_ms", self.default_tick_ms))
+                interval_ms = max(int(sim_cfg.get("interval_ms", self.default_tick_ms)), MIN_INTERVAL_MS)
+                mode = _resolve_mode(sim_cfg)
+                vmin = float(sim_cfg.get("min", 0.0))
+                vmax = float(sim_cfg.get("max", 100.0))
+                period_ms = float(sim_cfg.get("period_ms", 5000.0))
+                values = sim_cfg.get("values", [])
+                values = tuple(cast_fn(v) for v in values) if isinstance(values, list) else ()
                 self.bindings.append(
                     SimBinding(
                         node=var_node,
                         node_id=node_id,
-                        dtype=dtype,
-                        simulation=sim_cfg,
-                        next_due=time.monotonic() + interval_ms / 1000.0,
+                        next_due_ns=time.monotonic_ns() + interval_ms * 1_000_000,
+                        interval_ns=interval_ms * 1_000_000,
+                        step_fn=_STEP_HANDLERS[mode],
+                        cast_fn=cast_fn,
+                        variant_type=variant_type,
+                        step=float(sim_cfg.get("step", 1.0)),
+                        vmin=vmin,
+                        vmax=vmax,
+                        values=values,
+                        precast=_is_precast(mode, dtype_id),
+                        # Reduced mod 2*pi so a single subtraction keeps the phase wrapped.
+                        dphase=math.fmod(_TWO_PI * interval_ms / max(period_ms, 10.0), _TWO_PI),
+                        center=(vmax + vmin) / 2.0,
+                        amp=(vmax - vmin) / 2.0,
+                        last_value=initial,
+                        read_current=_reads_current(mode, sim_cfg),
                     )
                 )
 
-    async def _ensure_object_path(self, cache: dict[str, Any], ns_idx: int, path: str) -> Any:
-        norm = "/".join([p for p in str(path).split("/") if p])
-        if norm in cache:
-            return cache[norm]
-
-        parent_path, leaf = self._split_path(norm)
-        parent = await self._ensure_object_path(cache, ns_idx, parent_path) if norm else self.server.nodes.objects
-        if not norm:
-            return parent
+    async def _ensure_object_path(self, cache: dict[str, Any], ns_idx: int, parts: list[str]) -> Any:
+        # Walk back to the deepest cached ancestor, then create the missing tail.
+        depth = len(parts)
+        while depth and "/".join(parts[:depth]) not in cache:
+            depth -= 1
+        parent = cache["/".join(parts[:depth])]
 
-        node_id = f"ns={ns_idx};s={norm.replace('/', '.')}"
-        obj = await parent.add_object(node_id, leaf)
-        cache[norm] = obj
-        return obj
+        for depth in range(depth + 1, len(parts) + 1):
+            norm = "/".join(parts[:depth])
+            node_id = f"ns={ns_idx};s={norm.replace('/', '.')}"
+            parent = await parent.add_object(node_id, parts[depth - 1])
+            cache[norm] = parent
+        return parent
 
     @staticmethod
-    def _split_path(path: str) -> tuple[str, str]:
-        clean = "/".join([p for p in str(path).split("/") if p])
-        if "/" not in clean:
-            return "", clean
-        parent, leaf = clean.rsplit("/", 1)
-        return parent, leaf
+    def _path_parts(path: str) -> list[str]:
+        return [p for p in str(path).split("/") if p]
+
+    @classmethod
+    def _split_path(cls, path: str) -> tuple[list[str], str]:
+        parts = cls._path_parts(path)
+        if not parts:
+            return [], ""
+        return parts[:-1], parts[-1]
 
     async def run(self) -> None:
         async with self.server:
             print(f"[sim] running with {len(self.bindings)} simulated variables")
+            counter = itertools.count()
+            self._heap = [(b.next_due_ns, next(counter), b) for b in self.bindings]
+            heapq.heapify(self._heap)
+            if not self._heap:
+                await asyncio.Event().wait()
             while True:
-                await self._tick()
-                await asyncio.sleep(max(self.default_tick_ms, 100) / 1000.0)
-
-    async def _tick(self) -> None:
-        now = time.monotonic()
-        for b in self.bindings:
-            interval_ms = int(b.simulation.get("interval_ms", self.default_tick_ms))
-            if now < b.next_due:
+                now_ns = time.monotonic_ns()
+                due: list[SimBinding] = []
+                while self._heap and self._heap[0][0] <= now_ns:
+                    due.append(heapq.heappop(self._heap)[2])
+                if due:
+                    try:
+                        await self._fire(due, now_ns)
+                    finally:
+                        for b in due:
+                            heapq.heappush(self._heap, (b.next_due_ns, next(counter), b))
+                delay_ns = self._heap[0][0] - time.monotonic_ns()
+                # Overdue (e.g. after a slow write): just yield and fire on the next pass.
+                await asyncio.sleep(delay_ns / 1e9 if delay_ns > 0 else 0)
+
+    async def _fire(self, due: list[SimBinding], now_ns: int) -> None:
+        ready: list[SimBinding] = []
+        read_due: list[SimBinding] = []
+        for b in due:
+            b.next_due_ns = now_ns + b.interval_ns
+            (read_due if b.read_current else ready).append(b)
+
+        unexpected: BaseException | None = None
+        if read_due:
+            currents = await asyncio.gather(*(b.node.read_value() for b in read_due), return_exceptions=True)
+            for b, current in zip(read_due, currents):
+                if isinstance(current, BaseException):
+                    if not self._backoff(b, current, now_ns):
+                        unexpected = unexpected or current
+                    continue
+                b.last_value = current
+                ready.append(b)
+
+        pending: list[tuple[SimBinding, Any]] = []
+        for b in ready:
+            new_value = b.step_fn(b, now_ns, b.last_value)
+            casted = new_value if b.precast else b.cast_fn(new_value)
+            if casted != b.last_value:
+                pending.append((b, casted))
+            else:
+                b.fail_count = 0
+
+        results = await asyncio.gather(
+            *(b.node.write_value(ua.Variant(v, b.variant_type)) for b, v in pending),
+            return_exceptions=True,
+        )
+        for (b, casted), result in zip(pending, results):
+            if isinstance(result, BaseException):
+                if not self._backoff(b, result, now_ns):
+                    unexpected = unexpected or result
                 continue
+            b.last_value = casted
+            b.fail_count = 0
 
-            try:
-                current = await b.node.read_value()
-            except Exception:
-                continue
+        if unexpected is not None:
+            raise unexpected
 
-            mode = str(b.simulation.get("mode", "")).lower().strip()
-            new_value = current
-
-            if mode == "toggle":
-                new_value = not _to_bool(current)
-
-            elif mode == "random_walk":
-                step = float(b.simulation.get("step", 1.0))
-                minimum = float(b.simulation.get("min", 0.0))
-                maximum = float(b.simulation.get("max", 100.0))
-                cur = float(current)
-                cur += random.uniform(-step, step)
-                new_value = max(minimum, min(maximum, cur))
-
-            elif mode == "random_choice":
-                values = b.simulation.get("values", [])
-                if isinstance(values, list) and values:
-                    new_value = random.choice(values)
-
-            elif mode == "cycle":
-                values = b.simulation.get("values", [])
-                if isinstance(values, list) and values:
-                    b.cycle_index = (b.cycle_index + 1) % len(values)
-                    new_value = values[b.cycle_index]
-
-            elif mode == "ramp":
-                step = float(b.simulation.get("step", 1.0))
-                minimum = float(b.simulation.get("min", 0.0))
-                maximum = float(b.simulation.get("max", 100.0))
-                cur = float(current) + step
-                if cur > maximum:
-                    cur = minimum
-                if cur < minimum:
-                    cur = maximum
-                new_value = cur
-
-            elif mode == "sine":
-                minimum = float(b.simulation.get("min", 0.0))
-                maximum = float(b.simulation.get("max", 100.0))
-                period_ms = float(b.simulation.get("period_ms", 5000.0))
-                b.phase += (2 * math.pi) * (interval_ms / max(period_ms, 10.0))
-                center = (maximum + minimum) / 2.0
-                amp = (maximum - minimum) / 2.0
-                new_value = center + amp * math.sin(b.phase)
-
-            casted = _cast(b.dtype, new_value)
-            try:
-                await b.node.write_value(casted)
-            except Exception:
-                pass
-
-            b.next_due = now + interval_ms / 1000.0
+    @staticmethod
+    def _backoff(b: SimBinding, err: BaseException, now_ns: int) -> bool:
+        """Suspend ``b`` after a retryable error; return False for anything else."""
+        if not isinstance(err, _RETRYABLE_ERRORS):
+            return False
+        b.fail_count += 1
+        delay_ns = min(MAX_BACKOFF_NS, b.interval_ns << min(b.fail_count, 6))
+        b.next_due_ns = now_ns + delay_ns
+        if b.fail_count == 1:
+            print(f"[sim] {b.node_id}: {type(err).__name__}: {err}; backing off")
+        return True
 
 
 def _load_yaml(path: Path) -> dict[str, Any]:
     if not path.exists():
         raise FileNotFoundError(path)
     with path.open("r", encoding="utf-8") as f:
-        data = yaml.safe_load(f) or {}
+        data = yaml.load(f, Loader=_YAML_LOADER) or {}
     if not isinstance(data, dict):
         raise ValueError("Top-level YAML must be a mapping/object")
     return data
@@ -303,11 +503,13 @@ def _load_yaml(path: Path) -> dict[str, Any]:
 
 def _maybe_create_example(path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(EXAMPLE_CONFIG, encoding="utf-8")
+    path.write_bytes(_EXAMPLE_CONFIG_BYTES)
 
 
 async def _main() -> None:
     cfg_path = Path(os.environ.get("OPCUA_SIM_CONFIG_FILE", "/config/opcua_plc_simulator.yaml"))
+    if _YAML_LOADER is yaml.SafeLoader:
+        print("[sim] Warning: libyaml not available, using slow pure-Python YAML loader")
     auto_create = _to_bool(os.environ.get("OPCUA_SIM_AUTO_CREATE", True))
 
     if auto_create and not cfg_path.exists():
@@ -321,5 +523,15 @@ async def _main() -> None:
     await sim.run()
 
 
+def _run(main: Coroutine[Any, Any, None]) -> None:
+    try:
+        import uvloop
+    except ImportError:  # optional, falls back to the default asyncio loop
+        asyncio.run(main)
+        return
+    print("[sim] Using uvloop event loop")
+    uvloop.run(main)
+
+
 if __name__ == "__main__":
-    asyncio.run(_main())
+    _run(_main())